@@ -1,5 +1,6 @@
 
 # Tactical Logistics Configuration
+import os
 
 # API Configuration
 API_PORT = 8080
@@ -10,3 +11,6 @@ DEPOT_LNG = -86.7816
 
 # Fleet Configuration
 TRUCK_CAPACITY_KG = 1000
+
+# Routing Configuration
+OSRM_CACHE_DIR = os.getenv("OSRM_CACHE_DIR", "/tmp/osrm_cache")
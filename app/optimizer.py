@@ -22,31 +22,352 @@ VERSION: 1.0
 
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from numba import njit
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import json
+import math
+import os
 
 # Import configuration constants
 from .config import DEPOT_LAT, DEPOT_LNG, TRUCK_CAPACITY_KG
 
+# OR-Tools search strategy, kept at module level so it can be tuned
+# against recorded instances. Greedy descent stops at the first local
+# optimum instead of spending the whole time limit on a metaheuristic.
+TSP_FIRST_SOLUTION_STRATEGY = routing_enums_pb2.FirstSolutionStrategy.SAVINGS
+TSP_LOCAL_SEARCH_METAHEURISTIC = routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT
+
 
 # ============================================================================
 # HELPER FUNCTION: BUILD DISTANCE MATRIX
 # ============================================================================
+@njit(cache=True, nogil=True, fastmath=True)
+def _fill_distance_matrix(lat: np.ndarray, lng: np.ndarray, out: np.ndarray) -> None:
+    """Fill `out` with scaled Euclidean distances between all point pairs."""
+    n = lat.shape[0]
+    for i in range(n):
+        for j in range(n):
+            dx = lat[i] - lat[j]
+            dy = lng[i] - lng[j]
+            out[i, j] = int(math.sqrt(dx * dx + dy * dy) * 1000)
+
+
 def build_distance_matrix(coords: np.ndarray) -> np.ndarray:
     """
     Calculate the Euclidean distance matrix between all coordinate pairs.
     """
-    # Calculate difference between all coordinate pairs using NumPy broadcasting
-    # Shape: (N, 1, 2) - (1, N, 2) = (N, N, 2)
-    diff = coords[:, np.newaxis, :] - coords[np.newaxis, :, :]
+    # Compiled loop over the point pairs: no (N, N, 2) intermediate and
+    # the matrix is written directly as int32 for OR-Tools
+    lat = np.ascontiguousarray(coords[:, 0])
+    lng = np.ascontiguousarray(coords[:, 1])
+    dist_matrix = np.empty((len(coords), len(coords)), dtype=np.int32)
+    _fill_distance_matrix(lat, lng, dist_matrix)
+    return dist_matrix
+
+
+# Compile on import so the first request does not pay the JIT cost
+build_distance_matrix(np.zeros((2, 2), dtype=np.float32))
+
+
+# ============================================================================
+# HELPER FUNCTIONS: TSP SOLVERS
+# ============================================================================
+@njit(cache=True, nogil=True)
+def _held_karp(dist: np.ndarray) -> np.ndarray:
+    """Held-Karp bitmask DP over the stops; returns the tour starting at node 0."""
+    n = dist.shape[0] - 1  # Number of stops, excluding the depot
+    full = (1 << n) - 1
+    inf = np.int64(2**62)
+    
+    # cost[mask, j]: shortest path leaving the depot, visiting the stops in
+    # `mask` and ending at stop j; prev[mask, j] is the stop before j
+    cost = np.full((1 << n, n), inf, dtype=np.int64)
+    prev = np.full((1 << n, n), -1, dtype=np.int8)
+    for j in range(n):
+        cost[1 << j, j] = dist[0, j + 1]
+    
+    for mask in range(1, full + 1):
+        for j in range(n):
+            if not (mask >> j) & 1 or cost[mask, j] == inf:
+                continue
+            for k in range(n):
+                if (mask >> k) & 1:
+                    continue
+                candidate = cost[mask, j] + dist[j + 1, k + 1]
+                if candidate < cost[mask | (1 << k), k]:
+                    cost[mask | (1 << k), k] = candidate
+                    prev[mask | (1 << k), k] = j
     
-    # Calculate Euclidean distance: sqrt(dx^2 + dy^2)
-    dist_matrix = np.sqrt(np.sum(diff**2, axis=2))
+    best = inf
+    stop = 0
+    for j in range(n):
+        candidate = cost[full, j] + dist[j + 1, 0]
+        if candidate < best:
+            best = candidate
+            stop = j
     
-    # Convert to meters and cast to integer for OR-Tools
-    return (dist_matrix * 1000).astype(int)
+    tour = np.zeros(n + 1, dtype=np.int64)
+    mask = full
+    for position in range(n, 0, -1):
+        tour[position] = stop + 1
+        previous = prev[mask, stop]
+        mask ^= 1 << stop
+        stop = previous
+    
+    return tour
+
+
+def solve_tsp_exact(dist_matrix: np.ndarray) -> List[int]:
+    """
+    Solve a small TSP exactly with the Held-Karp dynamic program.
+    
+    Returns the visiting order as node indices, starting at the depot (0).
+    """
+    return _held_karp(dist_matrix).tolist()
+
+
+# Compile on import so the first request does not pay the JIT cost
+solve_tsp_exact(np.zeros((2, 2), dtype=np.int32))
+
+
+@lru_cache(maxsize=None)
+def _search_params(
+    first_solution_strategy: int,
+    local_search_metaheuristic: int,
+    time_limit_seconds: int,
+    solution_limit: int
+):
+    """
+    Build OR-Tools search parameters once per distinct setting.
+    
+    The returned proto is shared between solves and must not be mutated.
+    """
+    search_params = pywrapcp.DefaultRoutingSearchParameters()
+    search_params.first_solution_strategy = first_solution_strategy
+    search_params.local_search_metaheuristic = local_search_metaheuristic
+    search_params.log_search = False
+    search_params.time_limit.seconds = time_limit_seconds
+    search_params.solution_limit = solution_limit
+    return search_params
+
+
+def solve_tsp_ortools(dist_matrix: np.ndarray) -> List[int]:
+    """
+    Solve the TSP with the OR-Tools routing solver.
+    
+    Returns the visiting order as node indices starting at the depot (0),
+    or an empty list if no solution was found.
+    """
+    N = len(dist_matrix)
+    
+    # RoutingIndexManager: Maps between node indices and routing solver indices
+    manager = pywrapcp.RoutingIndexManager(N, 1, 0)
+    
+    # RoutingModel: The main TSP solver
+    routing = pywrapcp.RoutingModel(manager)
+    
+    # A transit matrix is read directly by the C++ solver, avoiding a
+    # Python callback round trip for every arc evaluation
+    transit_callback_index = routing.RegisterTransitMatrix(dist_matrix.tolist())
+    
+    # Set the cost function (we want to minimize total distance)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    
+    # solve_tsp_for_cluster only sends clusters of more than 15 stops here
+    # (smaller ones are solved exactly). Greedy descent usually finishes in
+    # tens of ms at these sizes, so the limits only bound unusual instances.
+    search_params = _search_params(
+        TSP_FIRST_SOLUTION_STRATEGY,
+        TSP_LOCAL_SEARCH_METAHEURISTIC,
+        1 if N < 50 else 2,
+        1000
+    )
+    
+    solution = routing.SolveWithParameters(search_params)
+    if not solution:
+        return []
+    
+    index = routing.Start(0)
+    route_nodes = []
+    while not routing.IsEnd(index):
+        route_nodes.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    
+    return route_nodes
+
+
+# ============================================================================
+# HELPER FUNCTION: K-MEANS CLUSTERING
+# ============================================================================
+@njit(cache=True, nogil=True, fastmath=True)
+def kmeans2d(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    k: int,
+    max_iterations: int = 50,
+    seed: int = 42
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    K-Means specialised for 2-D (lat, lng) points.
+    
+    Seeds centroids with k-means++ and runs Lloyd's iterations until the
+    labels stop changing. Returns the centroid latitudes and longitudes.
+    """
+    np.random.seed(seed)
+    n = lat.shape[0]
+    centroids_lat = np.empty(k)
+    centroids_lng = np.empty(k)
+    
+    # k-means++ seeding: pick each new centroid with probability
+    # proportional to its squared distance from the nearest existing one
+    first = np.random.randint(n)
+    centroids_lat[0] = lat[first]
+    centroids_lng[0] = lng[first]
+    closest = np.empty(n)
+    for i in range(n):
+        dlat = lat[i] - centroids_lat[0]
+        dlng = lng[i] - centroids_lng[0]
+        closest[i] = dlat * dlat + dlng * dlng
+    
+    for c in range(1, k):
+        target = np.random.random() * closest.sum()
+        pick = n - 1
+        cumulative = 0.0
+        for i in range(n):
+            cumulative += closest[i]
+            if cumulative > target:
+                pick = i
+                break
+        centroids_lat[c] = lat[pick]
+        centroids_lng[c] = lng[pick]
+        for i in range(n):
+            dlat = lat[i] - centroids_lat[c]
+            dlng = lng[i] - centroids_lng[c]
+            closest[i] = min(closest[i], dlat * dlat + dlng * dlng)
+    
+    labels = np.full(n, -1, dtype=np.int64)
+    sum_lat = np.empty(k)
+    sum_lng = np.empty(k)
+    count = np.empty(k)
+    
+    for _ in range(max_iterations):
+        changed = False
+        for i in range(n):
+            best = 0
+            best_dist = np.inf
+            for c in range(k):
+                dlat = lat[i] - centroids_lat[c]
+                dlng = lng[i] - centroids_lng[c]
+                d = dlat * dlat + dlng * dlng
+                if d < best_dist:
+                    best_dist = d
+                    best = c
+            if labels[i] != best:
+                labels[i] = best
+                changed = True
+        
+        if not changed:
+            break
+        
+        sum_lat[:] = 0.0
+        sum_lng[:] = 0.0
+        count[:] = 0.0
+        for i in range(n):
+            sum_lat[labels[i]] += lat[i]
+            sum_lng[labels[i]] += lng[i]
+            count[labels[i]] += 1
+        # Empty clusters keep their previous centroid
+        for c in range(k):
+            if count[c] > 0:
+                centroids_lat[c] = sum_lat[c] / count[c]
+                centroids_lng[c] = sum_lng[c] / count[c]
+    
+    return centroids_lat, centroids_lng
+
+
+# Compile on import so the first request does not pay the JIT cost
+kmeans2d(np.zeros(1), np.zeros(1), 1)
+
+
+# ============================================================================
+# HELPER FUNCTION: CAPACITY-AWARE ORDER ASSIGNMENT
+# ============================================================================
+@njit(cache=True, nogil=True)
+def assign_and_balance(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    weight: np.ndarray,
+    centroids_lat: np.ndarray,
+    centroids_lng: np.ndarray,
+    capacity: float,
+    max_iterations: int = 10
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assign orders to trucks by running Lloyd's iterations under a capacity limit.
+    
+    Each order goes to the nearest centroid whose truck still has room;
+    orders that fit nowhere are left unassigned (0). Returns 1-based truck
+    ids per order and each truck's load, summed in the same order used for
+    the capacity check.
+    """
+    n = lat.shape[0]
+    k = centroids_lat.shape[0]
+    centroids_lat = centroids_lat.copy()
+    centroids_lng = centroids_lng.copy()
+    cluster = np.full(n, -1, dtype=np.int64)
+    
+    # Heaviest orders pick first: light orders are easier to fit elsewhere
+    order = np.argsort(-weight)
+    dist = np.empty(k)
+    load = np.zeros(k)
+    
+    for _ in range(max_iterations):
+        load = np.zeros(k)
+        changed = False
+        
+        for idx in order:
+            for c in range(k):
+                dlat = lat[idx] - centroids_lat[c]
+                dlng = lng[idx] - centroids_lng[c]
+                dist[c] = dlat * dlat + dlng * dlng
+            
+            assigned = 0
+            for c in np.argsort(dist):
+                if load[c] + weight[idx] <= capacity:
+                    load[c] += weight[idx]
+                    assigned = c + 1
+                    break
+            
+            if assigned != cluster[idx]:
+                cluster[idx] = assigned
+                changed = True
+        
+        if not changed:
+            break
+        
+        # Move each centroid to the mean of its assigned orders
+        sum_lat = np.zeros(k)
+        sum_lng = np.zeros(k)
+        count = np.zeros(k)
+        for idx in range(n):
+            c = cluster[idx] - 1
+            if c >= 0:
+                sum_lat[c] += lat[idx]
+                sum_lng[c] += lng[idx]
+                count[c] += 1
+        for c in range(k):
+            if count[c] > 0:
+                centroids_lat[c] = sum_lat[c] / count[c]
+                centroids_lng[c] = sum_lng[c] / count[c]
+    
+    return cluster, load
+
+
+# Compile on import so the first request does not pay the JIT cost
+assign_and_balance(np.zeros(1), np.zeros(1), np.ones(1), np.zeros(1), np.zeros(1), 1.0)
 
 
 # ============================================================================
@@ -63,69 +384,39 @@ def solve_tsp_for_cluster(cluster_df: pd.DataFrame, depot: np.ndarray):
     # STEP 1: Build coordinate array
     # Node 0 = depot (start/end point)
     # Nodes 1..N = delivery locations
-    coords = np.vstack([depot, cluster_df[["lat","lng"]].values])
+    # float32 keeps ~1m precision for GPS coordinates at half the footprint
+    coords = np.vstack([depot, cluster_df[["lat","lng"]].values]).astype(np.float32, copy=False)
     
     # STEP 2: Build distance matrix
     dist_matrix = build_distance_matrix(coords)
     
-    # STEP 3: Set up OR-Tools routing model
+    # STEP 3: Solve the TSP
+    # Small clusters are solved exactly, which is faster than setting up
+    # the OR-Tools model and guarantees the optimal tour
     N = len(coords)  # Total number of nodes (depot + deliveries)
-    
-    # RoutingIndexManager: Maps between node indices and routing solver indices
-    manager = pywrapcp.RoutingIndexManager(N, 1, 0)
-    
-    # RoutingModel: The main TSP solver
-    routing = pywrapcp.RoutingModel(manager)
-    
-    # STEP 4: Define distance callback
-    def distance_callback(from_index, to_index):
-        """Return distance between two nodes."""
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return dist_matrix[from_node, to_node]
-    
-    # Register the callback with the solver
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    
-    # Set the cost function (we want to minimize total distance)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-    
-    # STEP 5: Configure search parameters
-    search_params = pywrapcp.DefaultRoutingSearchParameters()
-    search_params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    search_params.time_limit.seconds = 2
-    
-    # STEP 6: Solve the TSP
-    solution = routing.SolveWithParameters(search_params)
+    if N <= 16:  # Up to 15 stops plus the depot
+        route_nodes = solve_tsp_exact(dist_matrix)
+    else:
+        route_nodes = solve_tsp_ortools(dist_matrix)
     
     # If no solution found, return empty results
-    if not solution:
+    if not route_nodes:
         return [], 0.0, []
     
-    # STEP 7: Extract the solution
-    index = routing.Start(0)
-    route_nodes = []
-    route_distance = 0
+    route_distance = int(dist_matrix[route_nodes, route_nodes[1:] + [0]].sum())
     
-    while not routing.IsEnd(index):
-        node = manager.IndexToNode(index)
-        route_nodes.append(node)
-        next_index = solution.Value(routing.NextVar(index))
-        route_distance += routing.GetArcCostForVehicle(index, next_index, 0)
-        index = next_index
-    
-    # STEP 8: Convert solution to business format
-    stop_sequence = [cluster_df.iloc[node-1]["id"] for node in route_nodes[1:]]
+    # STEP 4: Convert solution to business format
+    # Pull the visited stops out in one positional lookup (node 0 is the depot)
+    stops_df = cluster_df.iloc[np.asarray(route_nodes[1:], dtype=np.int64) - 1]
+    stop_sequence = stops_df["id"].tolist()
+    stop_coords = stops_df[["lat", "lng"]].to_numpy(dtype=np.float64).tolist()
     distance_km = round(route_distance / 1000, 3)
     
-    # STEP 9: Get real street routes using OSRM
+    # STEP 5: Get real street routes using OSRM
     try:
         from .routing_service import get_route_for_sequence
         
-        sequence = [
-            (float(cluster_df.iloc[node-1]["lat"]), float(cluster_df.iloc[node-1]["lng"]))
-            for node in route_nodes[1:]
-        ]
+        sequence = list(map(tuple, stop_coords))
         
         route_info = get_route_for_sequence(sequence, depot)
         
@@ -153,10 +444,7 @@ def solve_tsp_for_cluster(cluster_df: pd.DataFrame, depot: np.ndarray):
         import logging
         logging.warning(f"OSRM routing failed, using fallback: {e}")
         
-        polyline = [depot.tolist()] + [
-            [float(cluster_df.iloc[node-1]["lat"]), float(cluster_df.iloc[node-1]["lng"])]
-            for node in route_nodes[1:]
-        ] + [depot.tolist()]
+        polyline = [depot.tolist()] + stop_coords + [depot.tolist()]
         
         total_duration = (distance_km / 40) * 60
         delivery_polyline = polyline[:-1]
@@ -178,51 +466,50 @@ def optimize_routes_json(orders: List[Dict], num_trucks: int = 5) -> Dict:
     if any(col not in df.columns for col in required_cols):
         raise ValueError(f"Orders must contain columns: {required_cols}")
     
-    X = df[["lat", "lng"]].values
-    effective_clusters = min(num_trucks, len(X))
-    kmeans = KMeans(n_clusters=effective_clusters, random_state=42, n_init=10)
-    df["truck_cluster"] = kmeans.fit_predict(X) + 1
+    lat = df["lat"].to_numpy(dtype=np.float64)
+    lng = df["lng"].to_numpy(dtype=np.float64)
+    effective_clusters = min(num_trucks, len(df))
+    centroids_lat, centroids_lng = kmeans2d(lat, lng, effective_clusters)
     
-    unassigned_orders = []
-    for i in range(3):
-        for truck_id in sorted(df["truck_cluster"].unique()):
-            cluster_df = df[df["truck_cluster"] == truck_id]
-            total_weight = cluster_df["weight_kg"].sum()
-            
-            if total_weight > TRUCK_CAPACITY_KG:
-                excess_df = cluster_df.sort_values(by="weight_kg", ascending=False)
-                for idx, row in excess_df.iterrows():
-                    if df[df["truck_cluster"] == truck_id]["weight_kg"].sum() <= TRUCK_CAPACITY_KG:
-                        break
-                    
-                    moved = False
-                    for other_id in sorted(df["truck_cluster"].unique()):
-                        if other_id == truck_id: continue
-                        other_weight = df[df["truck_cluster"] == other_id]["weight_kg"].sum()
-                        if other_weight + row["weight_kg"] <= TRUCK_CAPACITY_KG:
-                            df.loc[idx, "truck_cluster"] = other_id
-                            moved = True
-                            break
-    
-    for truck_id in sorted(df["truck_cluster"].unique()):
-        total_weight = df[df["truck_cluster"] == truck_id]["weight_kg"].sum()
-        while total_weight > TRUCK_CAPACITY_KG:
-            heaviest_idx = df[df["truck_cluster"] == truck_id]["weight_kg"].idxmax()
-            df.loc[heaviest_idx, "truck_cluster"] = 0
-            total_weight = df[df["truck_cluster"] == truck_id]["weight_kg"].sum()
+    # Capacity-aware assignment on plain arrays; 0 marks unassigned orders
+    df["truck_cluster"], truck_loads = assign_and_balance(
+        lat,
+        lng,
+        df["weight_kg"].to_numpy(dtype=np.float64),
+        centroids_lat,
+        centroids_lng,
+        float(TRUCK_CAPACITY_KG)
+    )
 
     depot = np.array([DEPOT_LAT, DEPOT_LNG])
     routes = []
     
-    for truck_id in sorted(df["truck_cluster"].unique()):
-        if truck_id == 0: continue
-        cluster_df = df[df["truck_cluster"] == truck_id].reset_index(drop=True)
-        stop_sequence, distance_km, polyline, delivery_polyline, return_polyline, duration_minutes, stop_etas = solve_tsp_for_cluster(cluster_df, depot)
+    # Split the orders by truck in a single pass; group 0 is unassigned
+    groups = {
+        truck_id: cluster_df.reset_index(drop=True)
+        for truck_id, cluster_df in df.groupby("truck_cluster", sort=True)
+    }
+    unassigned_df = groups.pop(0, df.iloc[:0])
+    truck_ids = list(groups)
+    clusters = list(groups.values())
+    
+    # Each truck's TSP solve and OSRM lookups are independent. The threads
+    # overlap the OSRM I/O and the Numba Held-Karp solves (which release
+    # the GIL); OR-Tools solves hold the GIL and still run one at a time.
+    # Worker count follows ThreadPoolExecutor's own default cap.
+    max_workers = min(len(clusters), 32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(lambda cluster_df: solve_tsp_for_cluster(cluster_df, depot), clusters))
+    
+    for truck_id, cluster_df, result in zip(truck_ids, clusters, results):
+        stop_sequence, distance_km, polyline, delivery_polyline, return_polyline, duration_minutes, stop_etas = result
         
         routes.append({
             "route_id": int(truck_id),
             "stop_sequence": stop_sequence,
-            "truck_load": float(cluster_df["weight_kg"].sum()),
+            # Reuse the kernel's sums: re-adding the weights in a different
+            # order can land one ulp over capacity for an exactly full truck
+            "truck_load": float(truck_loads[truck_id - 1]),
             "total_distance": distance_km,
             "total_duration": duration_minutes,
             "polyline": polyline,
@@ -231,7 +518,6 @@ def optimize_routes_json(orders: List[Dict], num_trucks: int = 5) -> Dict:
             "stop_etas": stop_etas
         })
     
-    unassigned_df = df[df["truck_cluster"] == 0]
     unassigned_ids = unassigned_df["id"].tolist()
     total_distance = round(sum(r["total_distance"] for r in routes), 3)
     
@@ -2,18 +2,42 @@
 OSRM Routing Service
 Provides real street-based routing using OpenStreetMap data
 """
-import requests
+import asyncio
+import threading
+import httpx
+import diskcache
+import numpy as np
+import math
+from numba import njit
 from typing import List, Tuple, Optional, Dict
-import time
-from functools import lru_cache
 import logging
 
+from .config import OSRM_CACHE_DIR
+
 logger = logging.getLogger(__name__)
 
-OSRM_BASE_URL = "http://router.project-osrm.org/route/v1/driving"
+OSRM_BASE_URL = "https://router.project-osrm.org/route/v1/driving"
 REQUEST_TIMEOUT = 10
 MAX_RETRIES = 3
 RETRY_DELAY = 1
+MAX_CONNECTIONS = 20
+EARTH_RADIUS_M = 6371000
+
+# Route cache shared by all worker processes. Coordinates are rounded to
+# CACHE_PRECISION decimals so float jitter in the inputs still hits.
+CACHE_TTL = 7 * 24 * 3600
+CACHE_PRECISION = 6
+# Treat a route and its reversal as the same cache entry
+SYMMETRIC_CACHE = False
+
+_cache: Optional[diskcache.Cache] = None
+_cache_lock = threading.Lock()
+
+# A single event loop thread owns the shared HTTP/2 client, so pooled
+# keep-alive connections are reused across requests and worker threads
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_client: Optional[httpx.AsyncClient] = None
 
 
 class RoutingError(Exception):
@@ -21,24 +45,90 @@ class RoutingError(Exception):
     pass
 
 
-@lru_cache(maxsize=1000)
-def get_route(
-    start_lat: float,
-    start_lng: float,
-    end_lat: float,
-    end_lng: float,
-    use_cache: bool = True
-) -> Dict:
-    """Get route between two points using OSRM API."""
-    url = f"{OSRM_BASE_URL}/{start_lng},{start_lat};{end_lng},{end_lat}"
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Start the background event loop on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="osrm-client", daemon=True).start()
+    return _loop
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared OSRM client. Must be called on the background loop."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+
+def _get_cache() -> diskcache.Cache:
+    """Open the route cache on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = diskcache.Cache(OSRM_CACHE_DIR)
+    return _cache
+
+
+def _submit(coro):
+    """Schedule a coroutine on the background loop."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def _cache_key(waypoints: Tuple[Tuple[float, float], ...]) -> Tuple[tuple, bool]:
+    """Return the cache key for a waypoint sequence and whether it is reversed."""
+    key = tuple((round(lat, CACHE_PRECISION), round(lng, CACHE_PRECISION)) for lat, lng in waypoints)
+    if SYMMETRIC_CACHE and key[::-1] < key:
+        return key[::-1], True
+    return key, False
+
+
+def _reverse_legs(legs: List[Dict]) -> List[Dict]:
+    """Turn the legs of a route into the legs of the same route driven backwards."""
+    return [{**leg, "polyline": leg["polyline"][::-1]} for leg in reversed(legs)]
+
+
+def _fetch_legs(waypoints: Tuple[Tuple[float, float], ...]) -> List[Dict]:
+    """Get every leg between consecutive waypoints, using the route cache."""
+    # Cache I/O happens on the calling thread so the SQLite reads and
+    # writes never block the shared event loop
+    cache = _get_cache()
+    key, reversed_key = _cache_key(waypoints)
+    legs = cache.get(key)
+    if legs is not None:
+        return _reverse_legs(legs) if reversed_key else legs
+    
+    legs = _submit(_request_legs(waypoints)).result()
+    # Fallback estimates are not cached so OSRM is retried next time
+    if not any(leg["is_fallback"] for leg in legs):
+        cache.set(key, _reverse_legs(legs) if reversed_key else legs, expire=CACHE_TTL)
+    return legs
+
+
+async def _request_legs(waypoints: Tuple[Tuple[float, float], ...]) -> List[Dict]:
+    """Get every leg between consecutive waypoints with a single OSRM request."""
+    client = _get_client()
+    coords_str = ";".join(f"{lng},{lat}" for lat, lng in waypoints)
+    url = f"{OSRM_BASE_URL}/{coords_str}"
     params = {
         "overview": "full",
-        "geometries": "geojson"
+        "geometries": "geojson",
+        "steps": "false",
+        "annotations": "distance"
     }
     
     for attempt in range(MAX_RETRIES):
         try:
-            response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
+            response = await client.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             
@@ -46,49 +136,95 @@ def get_route(
                 raise RoutingError(f"OSRM error: {data.get('message', 'Unknown error')}")
             
             route = data["routes"][0]
-            distance_m = route["distance"]
-            duration_s = route["duration"]
-            coordinates = route["geometry"]["coordinates"]
-            polyline = [[coord[1], coord[0]] for coord in coordinates]
+            # OSRM returns [lng, lat]; swap the columns in one pass
+            geometry = np.asarray(route["geometry"]["coordinates"], dtype=np.float64)[:, ::-1]
+            
+            # Each leg annotates one entry per geometry segment, and
+            # consecutive legs share the coordinate where they join
+            legs = []
+            leg_start = 0
+            for leg in route["legs"]:
+                leg_end = min(leg_start + len(leg["annotation"]["distance"]), len(geometry) - 1)
+                legs.append({
+                    "distance_km": round(leg["distance"] / 1000, 3),
+                    "duration_minutes": round(leg["duration"] / 60, 1),
+                    "polyline": geometry[leg_start:leg_end + 1].tolist(),
+                    "is_fallback": False
+                })
+                leg_start = leg_end
             
-            return {
-                "distance_km": round(distance_m / 1000, 3),
-                "duration_minutes": round(duration_s / 60, 1),
-                "polyline": polyline,
-                "is_fallback": False
-            }
+            return legs
             
-        except (requests.RequestException, RoutingError) as e:
+        except (httpx.HTTPError, RoutingError) as e:
             logger.warning(f"OSRM request failed (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
             if attempt < MAX_RETRIES - 1:
-                time.sleep(RETRY_DELAY * (2 ** attempt))
-            else:
-                return _euclidean_fallback(start_lat, start_lng, end_lat, end_lng)
+                await asyncio.sleep(RETRY_DELAY * (2 ** attempt))
     
-    return _euclidean_fallback(start_lat, start_lng, end_lat, end_lng)
+    return _straight_line_fallback(waypoints)
 
 
-def _euclidean_fallback(
+def get_route(
     start_lat: float,
     start_lng: float,
     end_lat: float,
-    end_lng: float
+    end_lng: float,
+    use_cache: bool = True
 ) -> Dict:
-    """Fallback to Euclidean distance."""
-    import math
-    dlat = end_lat - start_lat
-    dlng = end_lng - start_lng
-    distance_deg = math.sqrt(dlat**2 + dlng**2)
-    distance_km = distance_deg * 111
-    duration_minutes = (distance_km / 40) * 60
-    polyline = [[start_lat, start_lng], [end_lat, end_lng]]
+    """Get route between two points using OSRM API."""
+    return _fetch_legs(((start_lat, start_lng), (end_lat, end_lng)))[0]
+
+
+@njit(cache=True, fastmath=True)
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters between two points given in radians."""
+    sin_dlat = math.sin((lat2 - lat1) / 2)
+    sin_dlng = math.sin((lng2 - lng1) / 2)
+    a = sin_dlat * sin_dlat + math.cos(lat1) * math.cos(lat2) * sin_dlng * sin_dlng
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+@njit(cache=True, fastmath=True)
+def haversine_pairs(lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Distances in meters between consecutive points given in degrees."""
+    lats = np.radians(lats)
+    lngs = np.radians(lngs)
+    distances = np.empty(lats.shape[0] - 1)
+    for i in range(distances.shape[0]):
+        distances[i] = haversine(lats[i], lngs[i], lats[i + 1], lngs[i + 1])
+    return distances
+
+
+# Compile on import so the first fallback does not pay the JIT cost
+haversine_pairs(np.zeros(2), np.zeros(2))
+
+
+def _straight_line_fallback(waypoints: Tuple[Tuple[float, float], ...]) -> List[Dict]:
+    """Fallback to straight-line legs between consecutive waypoints."""
+    points = np.asarray(waypoints, dtype=np.float64)
+    distances_km = haversine_pairs(points[:, 0], points[:, 1]) / 1000
     
-    return {
-        "distance_km": round(distance_km, 3),
-        "duration_minutes": round(duration_minutes, 1),
-        "polyline": polyline,
-        "is_fallback": True
-    }
+    return [
+        {
+            "distance_km": round(distance_km, 3),
+            "duration_minutes": round((distance_km / 40) * 60, 1),
+            "polyline": [list(start), list(end)],
+            "is_fallback": True
+        }
+        for distance_km, start, end in zip(distances_km.tolist(), waypoints[:-1], waypoints[1:])
+    ]
+
+
+def _stitch_polylines(polylines: List[List[List[float]]]) -> np.ndarray:
+    """Join consecutive leg polylines, dropping the point shared at each join."""
+    total = len(polylines[0]) + sum(max(len(p) - 1, 0) for p in polylines[1:])
+    stitched = np.empty((total, 2))
+    stitched[:len(polylines[0])] = polylines[0]
+    position = len(polylines[0])
+    for p in polylines[1:]:
+        if len(p) > 1:
+            stitched[position:position + len(p) - 1] = p[1:]
+            position += len(p) - 1
+    return stitched
 
 
 def get_route_for_sequence(
@@ -97,42 +233,18 @@ def get_route_for_sequence(
 ) -> Dict:
     """Get complete route for a sequence of points."""
     waypoints = [depot] + sequence + [depot]
-    segments = []
-    total_distance = 0
-    total_duration = 0
-    complete_polyline = []
-    has_fallback = False
-    delivery_polyline = []
-    return_polyline = []
+    segments = _fetch_legs(tuple((float(lat), float(lng)) for lat, lng in waypoints))
+    total_distance = sum(route["distance_km"] for route in segments)
+    total_duration = sum(route["duration_minutes"] for route in segments)
+    has_fallback = any(route["is_fallback"] for route in segments)
     
-    for i in range(len(waypoints) - 1):
-        start = waypoints[i]
-        end = waypoints[i + 1]
-        route = get_route(start[0], start[1], end[0], end[1])
-        segments.append(route)
-        total_distance += route["distance_km"]
-        total_duration += route["duration_minutes"]
-        
-        if route["is_fallback"]:
-            has_fallback = True
-        
-        is_return_leg = (i == len(waypoints) - 2)
-        segment_coords = route["polyline"]
-        if is_return_leg:
-            if not return_polyline:
-                return_polyline.extend(segment_coords)
-            else:
-                return_polyline.extend(segment_coords[1:])
-        else:
-            if i == 0:
-                delivery_polyline.extend(segment_coords)
-            else:
-                delivery_polyline.extend(segment_coords[1:])
-                
-        if i == 0:
-            complete_polyline.extend(segment_coords)
-        else:
-            complete_polyline.extend(segment_coords[1:])
+    # Delivery and return polylines are slices of the complete one: the
+    # return leg starts at the point where the last delivery leg ends
+    complete = _stitch_polylines([route["polyline"] for route in segments])
+    return_start = len(complete) - len(segments[-1]["polyline"])
+    complete_polyline = complete.tolist()
+    delivery_polyline = complete_polyline[:return_start + 1] if len(segments) > 1 else []
+    return_polyline = complete_polyline[return_start:]
     
     return {
         "total_distance_km": round(total_distance, 3),
@@ -140,11 +252,11 @@ def get_route_for_sequence(
         "polyline": complete_polyline,
         "delivery_polyline": delivery_polyline,
         "return_polyline": return_polyline,
-        "segments": segments,
+        "segments": list(segments),
         "has_fallback": has_fallback
     }
 
 
 def clear_cache():
     """Clear the routing cache"""
-    get_route.cache_clear()
+    _get_cache().clear()
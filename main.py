@@ -7,6 +7,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field, conint
 from typing import List, Dict, Any
 import uvicorn
@@ -70,6 +71,15 @@ class OptimizeRequest(BaseModel):
 # API ENDPOINTS
 # ============================================================================
 
+def run_optimizer(orders: List[Dict[str, Any]], num_trucks: int) -> Dict[str, Any]:
+    """Import and run the optimizer; meant to be called from a worker thread."""
+    # Lazy import to keep cold-start fast for health checks. Importing the
+    # optimizer JIT-compiles its Numba kernels (seconds on an empty cache),
+    # so it must happen off the event loop.
+    from app.optimizer import optimize_routes_json
+    return optimize_routes_json(orders, num_trucks=num_trucks)
+
+
 @app.get("/")
 async def root():
     """Redirect root to dashboard"""
@@ -120,9 +130,10 @@ async def optimize_routes(payload: OptimizeRequest) -> Dict[str, Any]:
             o.model_dump() if hasattr(o, 'model_dump') else o.dict() 
             for o in orders
         ]
-        # Lazy import to keep cold-start fast for health checks
-        from app.optimizer import optimize_routes_json
-        result = optimize_routes_json(orders_dicts, num_trucks=int(num_trucks))
+        # Run the solver in a worker thread rather than directly on the event
+        # loop; OR-Tools solves still hold the GIL, so the loop can stall
+        # while one is running
+        result = await run_in_threadpool(run_optimizer, orders_dicts, int(num_trucks))
 
         # Validate optimizer output
         if not isinstance(result, dict) or "routes" not in result:
@@ -173,6 +184,9 @@ async def optimize_routes(payload: OptimizeRequest) -> Dict[str, Any]:
                 detail="Optimizer reported incorrect number of orders"
             )
 
+        # The Dict[str, Any] return type lets FastAPI serialize the result
+        # straight to JSON bytes through Pydantic, skipping jsonable_encoder
+        # and json.dumps for the large polylines
         return result
         
     except ValueError as e:
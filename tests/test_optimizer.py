@@ -0,0 +1,155 @@
+"""
+Tests for the route optimization kernels.
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from app import routing_service
+from app.config import TRUCK_CAPACITY_KG
+from app.optimizer import (
+    assign_and_balance,
+    build_distance_matrix,
+    kmeans2d,
+    optimize_routes_json,
+    solve_tsp_exact,
+)
+
+
+@pytest.fixture
+def offline_routing(monkeypatch):
+    """Make OSRM lookups fail so routes use the straight-line fallback."""
+    def unavailable(*args, **kwargs):
+        raise routing_service.RoutingError("OSRM unavailable in tests")
+    
+    monkeypatch.setattr(routing_service, "get_route_for_sequence", unavailable)
+
+
+def _tour_length(dist_matrix, route_nodes):
+    return int(dist_matrix[route_nodes, route_nodes[1:] + [0]].sum())
+
+
+@pytest.mark.parametrize("num_nodes", range(2, 10))
+def test_solve_tsp_exact_matches_brute_force(num_nodes):
+    rng = np.random.default_rng(num_nodes)
+    for _ in range(3):
+        coords = rng.uniform(0, 1, (num_nodes, 2)).astype(np.float32)
+        dist_matrix = build_distance_matrix(coords)
+        
+        route_nodes = solve_tsp_exact(dist_matrix)
+        best = min(
+            _tour_length(dist_matrix, [0] + list(order))
+            for order in itertools.permutations(range(1, num_nodes))
+        )
+        
+        assert route_nodes[0] == 0
+        assert sorted(route_nodes) == list(range(num_nodes))
+        assert _tour_length(dist_matrix, route_nodes) == best
+
+
+def test_build_distance_matrix_is_symmetric_int32():
+    coords = np.array([[0.0, 0.0], [3.0, 4.0], [0.0, 10.0]], dtype=np.float32)
+    dist_matrix = build_distance_matrix(coords)
+    
+    assert dist_matrix.dtype == np.int32
+    assert (dist_matrix == dist_matrix.T).all()
+    assert (np.diag(dist_matrix) == 0).all()
+    assert dist_matrix[0, 1] == 5000
+    assert dist_matrix[0, 2] == 10000
+
+
+def test_exactly_full_truck_is_not_reported_over_capacity(offline_routing):
+    # These weights sum to exactly 1000 kg; re-summing them in a different
+    # order gives 1000.0000000000001
+    weights = [85.8, 261.6, 23.2, 70.3, 38.6, 245.9, 118.1, 31.4, 69.7, 55.4]
+    orders = [
+        {"id": f"A{i}", "lat": 36.16 + i * 1e-4, "lng": -86.78, "weight_kg": w}
+        for i, w in enumerate(weights)
+    ] + [
+        {"id": f"B{i}", "lat": 36.30 + i * 1e-4, "lng": -86.60, "weight_kg": 50.0}
+        for i in range(3)
+    ]
+    
+    result = optimize_routes_json(orders, num_trucks=2)
+    
+    assert sorted(r["truck_load"] for r in result["routes"]) == [150.0, 1000.0]
+    assert all(r["truck_load"] <= TRUCK_CAPACITY_KG for r in result["routes"])
+    assert result["unassigned_orders"] == []
+
+
+def _random_orders(rng, num_orders):
+    return [
+        {
+            "id": f"ORD-{i:03d}",
+            "lat": 36.1627 + rng.uniform(-0.08, 0.08),
+            "lng": -86.7816 + rng.uniform(-0.10, 0.10),
+            "weight_kg": round(float(rng.uniform(20, 300)), 1),
+        }
+        for i in range(num_orders)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("num_orders,num_trucks", [(12, 3), (40, 5), (60, 4)])
+def test_every_order_is_routed_or_unassigned_once(offline_routing, seed, num_orders, num_trucks):
+    orders = _random_orders(np.random.default_rng(seed), num_orders)
+    
+    result = optimize_routes_json(orders, num_trucks=num_trucks)
+    
+    routed = [oid for r in result["routes"] for oid in r["stop_sequence"]]
+    placed = routed + result["unassigned_orders"]
+    assert sorted(placed) == sorted(o["id"] for o in orders)
+    assert result["num_orders"] == num_orders
+    assert all(r["truck_load"] <= TRUCK_CAPACITY_KG for r in result["routes"])
+
+
+def test_assign_and_balance_respects_capacity():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = int(rng.integers(5, 40))
+        k = int(rng.integers(1, 6))
+        lat = rng.uniform(0, 1, n)
+        lng = rng.uniform(0, 1, n)
+        weight = np.round(rng.uniform(20, 300, n), 1)
+        
+        cluster, load = assign_and_balance(
+            lat, lng, weight, rng.uniform(0, 1, k), rng.uniform(0, 1, k), 1000.0
+        )
+        
+        assert cluster.min() >= 0 and cluster.max() <= k
+        assert (load <= 1000.0).all()
+        for c in range(k):
+            assert load[c] == pytest.approx(weight[cluster == c + 1].sum())
+        # An order is only left unassigned if no truck had room for it
+        for idx in np.flatnonzero(cluster == 0):
+            assert (load + weight[idx] > 1000.0).all()
+
+
+def test_kmeans2d_separates_distinct_groups():
+    rng = np.random.default_rng(0)
+    centers = np.array([[36.0, -87.0], [36.5, -86.5], [35.5, -86.0]])
+    points = np.vstack([c + rng.normal(0, 0.01, (20, 2)) for c in centers])
+    
+    centroids_lat, centroids_lng = kmeans2d(points[:, 0].copy(), points[:, 1].copy(), 3)
+    centroids = np.column_stack([centroids_lat, centroids_lng])
+    
+    # Each true center has exactly one centroid close to it
+    nearest = [int(np.argmin(np.linalg.norm(centroids - c, axis=1))) for c in centers]
+    assert sorted(nearest) == [0, 1, 2]
+    for c, i in zip(centers, nearest):
+        assert np.linalg.norm(centroids[i] - c) < 0.02
+
+
+def test_kmeans2d_with_one_cluster_per_point():
+    rng = np.random.default_rng(1)
+    lat = rng.uniform(36.0, 36.5, 8)
+    lng = rng.uniform(-87.0, -86.5, 8)
+    
+    first = kmeans2d(lat, lng, 8)
+    second = kmeans2d(lat, lng, 8)
+    
+    assert np.array_equal(first[0], second[0])
+    assert np.array_equal(first[1], second[1])
+    assert np.isfinite(first[0]).all() and np.isfinite(first[1]).all()
+    assert sorted(zip(first[0], first[1])) == sorted(zip(lat, lng))
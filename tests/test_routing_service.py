@@ -0,0 +1,120 @@
+"""
+Tests for the OSRM routing service, using a mocked OSRM server.
+"""
+import diskcache
+import httpx
+import pytest
+
+from app import routing_service
+
+
+DEPOT = (36.1627, -86.7816)
+STOP_B = (36.1700, -86.7700)
+STOP_C = (36.1800, -86.7600)
+
+# Full overview geometry for depot -> B -> C -> depot, as OSRM's [lng, lat].
+# Legs have 2, 1 and 3 segments; consecutive legs share their join point.
+OVERVIEW = [
+    [DEPOT[1], DEPOT[0]],
+    [-86.7750, 36.1650],
+    [STOP_B[1], STOP_B[0]],
+    [STOP_C[1], STOP_C[0]],
+    [-86.7650, 36.1750],
+    [-86.7750, 36.1700],
+    [DEPOT[1], DEPOT[0]],
+]
+
+OSRM_RESPONSE = {
+    "code": "Ok",
+    "routes": [{
+        "geometry": {"type": "LineString", "coordinates": OVERVIEW},
+        "legs": [
+            {"distance": 1500.0, "duration": 120.0, "annotation": {"distance": [700.0, 800.0]}},
+            {"distance": 1200.0, "duration": 90.0, "annotation": {"distance": [1200.0]}},
+            {"distance": 2500.0, "duration": 240.0, "annotation": {"distance": [900.0, 800.0, 800.0]}},
+        ],
+    }],
+}
+
+
+def _latlng(points):
+    return [[lat, lng] for lng, lat in points]
+
+
+@pytest.fixture
+def osrm(monkeypatch, tmp_path):
+    """Route OSRM requests to a mock handler and use a throwaway cache."""
+    calls = []
+    responses = {"status": 200, "json": OSRM_RESPONSE}
+    
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(responses["status"], json=responses["json"])
+    
+    cache = diskcache.Cache(str(tmp_path))
+    monkeypatch.setattr(routing_service, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(routing_service, "_cache", cache)
+    monkeypatch.setattr(routing_service, "RETRY_DELAY", 0)
+    yield calls, responses
+    cache.close()
+
+
+def test_sequence_is_fetched_in_one_request(osrm):
+    calls, _ = osrm
+    routing_service.get_route_for_sequence([STOP_B, STOP_C], DEPOT)
+    
+    assert len(calls) == 1
+    assert calls[0].url.path.endswith(
+        f"{DEPOT[1]},{DEPOT[0]};{STOP_B[1]},{STOP_B[0]};{STOP_C[1]},{STOP_C[0]};{DEPOT[1]},{DEPOT[0]}"
+    )
+
+
+def test_overview_geometry_is_split_into_legs(osrm):
+    route = routing_service.get_route_for_sequence([STOP_B, STOP_C], DEPOT)
+    
+    segments = route["segments"]
+    assert [s["polyline"] for s in segments] == [
+        _latlng(OVERVIEW[0:3]),
+        _latlng(OVERVIEW[2:4]),
+        _latlng(OVERVIEW[3:7]),
+    ]
+    assert [s["distance_km"] for s in segments] == [1.5, 1.2, 2.5]
+    assert [s["duration_minutes"] for s in segments] == [2.0, 1.5, 4.0]
+    assert route["total_distance_km"] == 5.2
+    assert route["total_duration_minutes"] == 7.5
+    assert route["has_fallback"] is False
+
+
+def test_polylines_are_stitched_without_duplicate_joins(osrm):
+    route = routing_service.get_route_for_sequence([STOP_B, STOP_C], DEPOT)
+    
+    assert route["polyline"] == _latlng(OVERVIEW)
+    assert route["delivery_polyline"] == _latlng(OVERVIEW[0:4])
+    assert route["return_polyline"] == _latlng(OVERVIEW[3:7])
+
+
+def test_repeated_sequence_is_served_from_cache(osrm):
+    calls, _ = osrm
+    first = routing_service.get_route_for_sequence([STOP_B, STOP_C], DEPOT)
+    # Float jitter below the cache precision still hits the same entry
+    jittered = [(STOP_B[0] + 1e-9, STOP_B[1]), STOP_C]
+    second = routing_service.get_route_for_sequence(jittered, DEPOT)
+    
+    assert len(calls) == 1
+    assert second["polyline"] == first["polyline"]
+
+
+def test_failed_request_falls_back_to_straight_lines(osrm):
+    calls, responses = osrm
+    responses["status"] = 500
+    route = routing_service.get_route_for_sequence([STOP_B, STOP_C], DEPOT)
+    
+    assert len(calls) == routing_service.MAX_RETRIES
+    assert route["has_fallback"] is True
+    assert route["polyline"] == [list(DEPOT), list(STOP_B), list(STOP_C), list(DEPOT)]
+    assert route["delivery_polyline"] == [list(DEPOT), list(STOP_B), list(STOP_C)]
+    assert route["return_polyline"] == [list(STOP_C), list(DEPOT)]
+    
+    # Fallback results are not cached, so OSRM is retried on the next call
+    routing_service.get_route_for_sequence([STOP_B, STOP_C], DEPOT)
+    assert len(calls) == 2 * routing_service.MAX_RETRIES